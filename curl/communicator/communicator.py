@@ -5,8 +5,11 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import inspect
 import logging
-import timeit
+import time
+import types
+from functools import wraps
 
 import torch
 
@@ -19,6 +22,10 @@ class Communicator:
     # Determines whether communicators log communication stats
     __verbosity = False
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._bind_logging()
+
     @classmethod
     def is_verbose(cls):
         return cls.__verbosity
@@ -27,6 +34,34 @@ class Communicator:
     def set_verbosity(cls, verbosity):
         assert isinstance(verbosity, bool), "Verbosity must be a boolean value"
         cls.__verbosity = verbosity
+        cls._bind_logging()
+
+    @classmethod
+    def _bind_logging(cls):
+        """
+        Binds the logging wrappers of methods decorated with `_logging` when
+        verbose, and the undecorated methods otherwise.
+        """
+        classes = [cls]
+        for klass in classes:
+            classes.extend(klass.__subclasses__())
+            attr_name = "_logging_wrapper" if klass.is_verbose() else "_logged_func"
+            for name, attr in list(vars(klass).items()):
+                method = getattr(attr, attr_name, None)
+                if method is not None:
+                    setattr(klass, name, method)
+
+    def _bind_single_party(self, names, copy=False):
+        """
+        Binds implementations of the methods in `names` that do not communicate,
+        for use when there is only a single party. The rebound methods return
+        copies of their inputs if `copy` is set, and the inputs themselves
+        otherwise.
+        """
+        for name in names:
+            attr = getattr(type(self), name)
+            func = getattr(attr, "_logged_func", attr)
+            setattr(self, name, types.MethodType(_single_party(func, copy=copy), self))
 
     @classmethod
     def is_initialized(cls):
@@ -55,6 +90,14 @@ class Communicator:
         """Receives a tensor from an (optional) source src."""
         raise NotImplementedError("recv is not implemented")
 
+    def send_coalesced(self, tensors, dst):
+        """Sends a list of tensors to the destination dst in a single message."""
+        raise NotImplementedError("send_coalesced is not implemented")
+
+    def recv_coalesced(self, tensors, src=None):
+        """Receives a list of tensors sent via `send_coalesced` from src."""
+        raise NotImplementedError("recv_coalesced is not implemented")
+
     def scatter(self, scatter_list, src, size=None, async_op=False):
         """Scatters a list of tensors to all parties."""
         raise NotImplementedError("scatter is not implemented")
@@ -67,6 +110,10 @@ class Communicator:
         """Reduces the tensor data across all parties; all get the final result."""
         raise NotImplementedError("tensor is not implemented")
 
+    def all_reduce_coalesced(self, tensors, op=None):
+        """Reduces a list of tensors across all parties in a single round."""
+        raise NotImplementedError("all_reduce_coalesced is not implemented")
+
     def gather(self, tensor, dst, async_op=False):
         """Gathers a list of tensors in a single party."""
         raise NotImplementedError("gather is not implemented")
@@ -119,24 +166,33 @@ class Communicator:
         """Resets communication statistics."""
         self.comm_rounds = 0
         self.comm_bytes = 0
-        self.comm_time = 0
+        self.comm_time_ns = 0
+
+    def get_communication_stats(self):
+        """Returns communication statistics, with the time in seconds."""
+        return {
+            "rounds": self.comm_rounds,
+            "bytes": self.comm_bytes,
+            "time": self.comm_time_ns / 1e9,
+        }
 
     def print_communication_stats(self):
         """Prints communication statistics."""
         import curl
 
+        stats = self.get_communication_stats()
         curl.log("====Communication Stats====")
-        curl.log("Rounds: {}".format(self.comm_rounds))
-        curl.log("Bytes : {}".format(self.comm_bytes))
-        curl.log("Comm time: {}".format(self.comm_time))
+        curl.log("Rounds: %d", stats["rounds"])
+        curl.log("Bytes : %d", stats["bytes"])
+        curl.log("Comm time: %s", stats["time"])
 
-    def _log_communication(self, nelement):
+    def _log_communication(self, nbytes):
         """Updates log of communication statistics."""
         self.comm_rounds += 1
-        self.comm_bytes += nelement * self.BYTES_PER_ELEMENT
+        self.comm_bytes += nbytes
 
-    def _log_communication_time(self, comm_time):
-        self.comm_time += comm_time
+    def _log_communication_time(self, comm_time_ns):
+        self.comm_time_ns += comm_time_ns
 
     def get_generator(self, idx, device=None):
         """
@@ -167,37 +223,97 @@ class Communicator:
 
 
 def _logging(func):
-    """Decorator that performs logging of communication statistics."""
+    """
+    Decorator that performs logging of communication statistics.
 
+    The logging wrapper is only bound while the communicator is verbose (see
+    `Communicator._bind_logging`), so that non-verbose calls incur no overhead.
+    """
+
+    @wraps(func)
     def logging_wrapper(self, *args, **kwargs):
+        if func.__name__ == "barrier":
+            self._log_communication(0)
+        elif func.__name__ == "scatter":  # N - 1 tensors communicated
+            self._log_communication(_nbytes(args[0][0]) * (len(args[0]) - 1))
+        elif "batched" in kwargs and kwargs["batched"]:
+            nbytes = sum(_nbytes(x) for x in args[0])
+            self._log_communication(nbytes)
+        else:  # one tensor communicated
+            self._log_communication(_nbytes(args[0]))
+
+        tic = time.perf_counter_ns()
+        result = func(self, *args, **kwargs)
+        self._log_communication_time(time.perf_counter_ns() - tic)
+        return result
+
+    func._logging_wrapper = logging_wrapper
+    logging_wrapper._logged_func = func
+    return logging_wrapper
+
+
+def _bucket_by_type(tensors):
+    """Groups the indices of `tensors` by dtype and device for coalescing."""
+    buckets = {}
+    for idx, tensor in enumerate(tensors):
+        buckets.setdefault((tensor.dtype, tensor.device), []).append(idx)
+    return list(buckets.values())
+
+
+def _nbytes(tensor):
+    """
+    Returns the number of bytes in `tensor`, based on the width of its dtype.
+    Objects that are not tensors are not counted.
+    """
+    if not hasattr(tensor, "nelement"):
+        return 0
+    return tensor.nelement() * tensor.data.element_size()
+
+
+def _single_party(func, copy=False):
+    """
+    Returns an implementation of `func` for a single party, which has nobody to
+    communicate with and therefore returns its input. If `copy` is set, tensors
+    are cloned before they are returned so that the result does not alias the
+    input.
+    """
+
+    # methods that take a group only skip communication in the main group (other
+    # groups, such as the one shared with the TTP, have more than one party):
+    parameters = list(inspect.signature(func).parameters)
+    group_index = parameters.index("group") - 1 if "group" in parameters else None
+
+    def other_group(self, args, kwargs):
+        if group_index is None:
+            return False
+        group = args[group_index] if len(args) > group_index else None
+        group = kwargs.get("group", group)
+        return group is not None and group is not self.main_group
+
+    def result(value):
+        if not copy:
+            return value
+        if isinstance(value, list):
+            return [result(x) for x in value]
+        return value.clone() if hasattr(value, "clone") else value
+
+    if func.__name__ in ["gather", "all_gather"]:
+
+        def single_party_func(self, tensor, *args, **kwargs):
+            return [result(tensor)]
+
+    elif func.__name__ == "scatter":
+
+        def single_party_func(self, scatter_list, *args, **kwargs):
+            return result(scatter_list[0])
+
+    else:
+
+        def single_party_func(self, *args, **kwargs):
+            if other_group(self, args, kwargs):
+                return getattr(type(self), func.__name__)(self, *args, **kwargs)
+            if len(args) > 0:
+                return result(args[0])
+            return func(self, *args, **kwargs)
 
-        # TODO: Replace this
-        # - hacks the inputs into some of the functions for world_size 1:
-        if self.get_world_size() < 2:
-            if func.__name__ in ["gather", "all_gather"]:
-                return [args[0]]
-            elif len(args) > 0:
-                return args[0]
-
-        # only log if needed:
-        if self.is_verbose():
-            if func.__name__ == "barrier":
-                self._log_communication(0, 1)
-            elif func.__name__ == "scatter":  # N - 1 tensors communicated
-                self._log_communication(args[0][0].nelement() * (len(args[0]) - 1))
-            elif "batched" in kwargs and kwargs["batched"]:
-                nbytes = sum(x.nelement() for x in args[0])
-                self._log_communication(nbytes)
-            else:  # one tensor communicated
-                self._log_communication(args[0].nelement())
-
-            tic = timeit.default_timer()
-            result = func(self, *args, **kwargs)
-            toc = timeit.default_timer()
-
-            self._log_communication_time(toc - tic)
-            return result
-
-        return func(self, *args, **kwargs)
-
-    return logging_wrapper
\ No newline at end of file
+    return single_party_func
@@ -15,9 +15,11 @@ import numpy
 import torch
 import torch.distributed as dist
 from curl.common import serial
+from curl.config import cfg
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 from torch.distributed import ReduceOp
 
-from .communicator import _logging, Communicator
+from .communicator import _bucket_by_type, _logging, Communicator
 
 
 class DistributedCommunicator(Communicator):
@@ -27,7 +29,24 @@ class DistributedCommunicator(Communicator):
     running on different nodes.
     """
 
-    BYTES_PER_ELEMENT = 8
+    # all-reduces on payloads smaller than this use recursive doubling, which
+    # takes log2(N) latency-bound steps instead of the 2(N - 1) steps of a ring:
+    RECURSIVE_DOUBLING_MAX_BYTES = 256 * 1024
+    # in worlds larger than this, the source of a broadcast sends to this many
+    # parties at a time instead of to all of them at once:
+    BROADCAST_WAVE_SIZE = 8
+    # collectives that a single party implements without communicating; the
+    # point-to-point methods and barrier are not rebound:
+    SINGLE_PARTY_METHODS = [
+        "scatter",
+        "reduce",
+        "all_reduce",
+        "all_reduce_coalesced",
+        "gather",
+        "all_gather",
+        "broadcast",
+        "broadcast_obj",
+    ]
     instance = None
 
     def __init__(self, init_ttp=False):
@@ -45,11 +64,29 @@ class DistributedCommunicator(Communicator):
             self.reset_communication_stats()
             self._name = f"rank{self.rank}"
 
+            # apply the NCCL settings requested in the config, which NCCL reads
+            # when the process groups are created:
+            cuda_backend = os.environ.get(
+                "DISTRIBUTED_CUDA_BACKEND", self.distributed_backend
+            ).lower()
+            if "nccl" in [self.distributed_backend.lower(), cuda_backend]:
+                nccl_env = cfg.communicator.get("nccl_env") or {}
+                for key, val in nccl_env.items():
+                    assert key.startswith("NCCL_"), f"{key} is not an NCCL setting"
+                    os.environ.setdefault(key, str(val))
+
             # initialize process group:
             total_ws = self.world_size + 1 if init_ttp else self.world_size
-            logging.info(f"DistributedCommunicator ({self.rank}): Total world size {total_ws}, init_ttp: {init_ttp}")
-            logging.info(f"distributed_backend ({self.rank}): {self.distributed_backend}")
-            logging.info(f"rendezvous ({self.rank}): {self.rendezvous}")
+            logging.info(
+                "DistributedCommunicator (%d): Total world size %d, init_ttp: %s",
+                self.rank,
+                total_ws,
+                init_ttp,
+            )
+            logging.info(
+                "distributed_backend (%d): %s", self.rank, self.distributed_backend
+            )
+            logging.info("rendezvous (%d): %s", self.rank, self.rendezvous)
 
             dist.init_process_group(
                 backend=self.distributed_backend,
@@ -64,6 +101,23 @@ class DistributedCommunicator(Communicator):
             self.main_group = dist.new_group(list(range(self.world_size)))
             self.ttp_initialized = init_ttp
 
+            # point-to-point ops are only supported on the backend's native device
+            # (the TTP is not in the main group, so query the default group):
+            backend = dist.get_backend()
+            self._p2p_device_type = "cuda" if backend == "nccl" else "cpu"
+
+            # optionally gather CUDA tensors via a separate backend (e.g., nccl
+            # when the main backend is gloo) to avoid copies through the host:
+            self._cuda_group = None
+            if cuda_backend != backend:
+                self._cuda_group = dist.new_group(
+                    list(range(self.world_size)), backend=cuda_backend
+                )
+
+            # a single party does not need to communicate:
+            if self.world_size < 2:
+                self._bind_single_party(self.SINGLE_PARTY_METHODS)
+
     @classmethod
     def is_initialized(cls):
         if cls.instance is None:
@@ -106,6 +160,8 @@ class DistributedCommunicator(Communicator):
             cls.instance.send_obj(
                 "terminate", cls.instance.get_ttp_rank(), cls.instance.ttp_group
             )
+        if cls.instance._cuda_group is not None:
+            dist.destroy_process_group(cls.instance._cuda_group)
         dist.destroy_process_group(cls.instance.main_group)
         dist.destroy_process_group(cls.instance.ttp_group)
         dist.destroy_process_group()
@@ -125,6 +181,23 @@ class DistributedCommunicator(Communicator):
         dist.recv(result.data, src=src, group=self.main_group)
         return result
 
+    def send_coalesced(self, tensors, dst):
+        """Sends a list of tensors to the destination dst in a single message."""
+        tensors = [tensor.data for tensor in tensors]
+        assert (
+            len(_bucket_by_type(tensors)) == 1
+        ), "send_coalesced tensors must share dtype and device"
+        self.send(_flatten_dense_tensors(tensors), dst)
+
+    def recv_coalesced(self, tensors, src=None):
+        """Receives a list of tensors sent via `send_coalesced` from src."""
+        result = [tensor.clone() for tensor in tensors]
+        buffers = [tensor.data for tensor in result]
+        flat = self.recv(_flatten_dense_tensors(buffers), src=src)
+        for buffer, synced in zip(buffers, _unflatten_dense_tensors(flat, buffers)):
+            buffer.copy_(synced)
+        return result
+
     @_logging
     def isend(self, tensor, dst):
         """Sends the specified tensor to the destination dst."""
@@ -164,16 +237,12 @@ class DistributedCommunicator(Communicator):
 
         if batched:
             assert isinstance(input, list), "batched reduce input must be a list"
-            reqs = []
             result = [x.clone().data for x in input]
-            for tensor in result:
-                reqs.append(
-                    dist.reduce(
-                        tensor.data, dst, op=op, group=self.main_group, async_op=True
-                    )
-                )
-            for req in reqs:
-                req.wait()
+            self._coalesced_(
+                lambda tensor: dist.reduce(tensor, dst, op=op, group=self.main_group),
+                result,
+                copy_back=self.rank == dst,
+            )
         else:
             assert torch.is_tensor(
                 input.data
@@ -190,24 +259,87 @@ class DistributedCommunicator(Communicator):
 
         if batched:
             assert isinstance(input, list), "batched reduce input must be a list"
-            reqs = []
             result = [x.clone() for x in input]
-            for tensor in result:
-                reqs.append(
-                    dist.all_reduce(
-                        tensor.data, op=op, group=self.main_group, async_op=True
-                    )
-                )
-            for req in reqs:
-                req.wait()
+            self._all_reduce_coalesced_([x.data for x in result], op=op)
         else:
             assert torch.is_tensor(
                 input.data
             ), "unbatched input for reduce must be a torch tensor"
             result = input.clone()
-            dist.all_reduce(result.data, op=op, group=self.main_group)
+            self._all_reduce_(result.data, op=op)
         return result
 
+    def all_reduce_coalesced(self, tensors, op=ReduceOp.SUM):
+        """Reduces a list of tensors across all parties in a single round."""
+        return self.all_reduce(tensors, op=op, batched=True)
+
+    def _all_reduce_coalesced_(self, tensors, op=ReduceOp.SUM):
+        """In-place all-reduce of `tensors` with one collective per bucket."""
+        self._coalesced_(lambda tensor: self._all_reduce_(tensor, op=op), tensors)
+
+    def _coalesced_(self, collective, tensors, copy_back=True):
+        """
+        Applies the in-place `collective` to `tensors`, issuing one call per
+        (dtype, device) bucket rather than one per tensor. The results are only
+        copied back into `tensors` if `copy_back` is set.
+        """
+        for indices in _bucket_by_type(tensors):
+            bucket = [tensors[idx] for idx in indices]
+            if len(bucket) == 1 and bucket[0].is_contiguous():
+                collective(bucket[0])
+                continue
+            flat = _flatten_dense_tensors(bucket)
+            collective(flat)
+            if copy_back:
+                for tensor, synced in zip(
+                    bucket, _unflatten_dense_tensors(flat, bucket)
+                ):
+                    tensor.copy_(synced)
+
+    def _all_reduce_(self, tensor, op=ReduceOp.SUM):
+        """In-place all-reduce that picks the algorithm based on payload size."""
+        if self._use_recursive_doubling(tensor, op):
+            self._recursive_doubling_all_reduce_(tensor)
+        else:
+            dist.all_reduce(tensor, op=op, group=self.main_group)
+
+    def _use_recursive_doubling(self, tensor, op):
+        world_size = self.get_world_size()
+        return (
+            op == ReduceOp.SUM
+            and world_size & (world_size - 1) == 0
+            and tensor.device.type == self._p2p_device_type
+            and tensor.nelement() * tensor.element_size()
+            < self.RECURSIVE_DOUBLING_MAX_BYTES
+        )
+
+    def _recursive_doubling_all_reduce_(self, tensor):
+        """
+        In-place sum all-reduce via recursive doubling: in step `i`, every party
+        exchanges its partial sum with the party whose rank differs in bit `i`.
+        Requires the world size to be a power of two.
+        """
+        # point-to-point ops require contiguous buffers:
+        result = tensor.contiguous()
+        received = torch.empty_like(result)
+        distance = 1
+        while distance < self.world_size:
+            peer = self.rank ^ distance
+            # issue the exchange as one group, so that NCCL does not serialize
+            # (or deadlock on) the send and receive between the same parties:
+            reqs = dist.batch_isend_irecv(
+                [
+                    dist.P2POp(dist.isend, result, peer, self.main_group),
+                    dist.P2POp(dist.irecv, received, peer, self.main_group),
+                ]
+            )
+            for req in reqs:
+                req.wait()
+            result.add_(received)
+            distance *= 2
+        if result is not tensor:
+            tensor.copy_(result)
+
     @_logging
     def gather(self, tensor, dst):
         """Gathers a list of tensors in a single party."""
@@ -234,7 +366,10 @@ class DistributedCommunicator(Communicator):
             result.append(
                 torch.empty(size=tensor.size(), dtype=torch.long, device=device)
             )
-        dist.all_gather(result, tensor.data, group=self.main_group)
+        group = self.main_group
+        if self._cuda_group is not None and device.type == "cuda":
+            group = self._cuda_group
+        dist.all_gather(result, tensor.data, group=group)
         return result
 
     @_logging
@@ -244,20 +379,73 @@ class DistributedCommunicator(Communicator):
         group = self.main_group if group is None else group
         if batched:
             assert isinstance(input, list), "batched reduce input must be a list"
-            reqs = []
-            for tensor in input:
-                reqs.append(
-                    dist.broadcast(tensor.data, src, group=group, async_op=True)
-                )
-            for req in reqs:
-                req.wait()
+            if self._use_broadcast_waves(input, group):
+
+                def broadcast_(tensor):
+                    self._broadcast_in_waves_([tensor], src)
+
+            else:
+
+                def broadcast_(tensor):
+                    dist.broadcast(tensor, src, group=group)
+
+            self._coalesced_(
+                broadcast_,
+                [tensor.data for tensor in input],
+                copy_back=self.rank != src,
+            )
         else:
             assert torch.is_tensor(
                 input.data
             ), "unbatched input for reduce must be a torch tensor"
-            dist.broadcast(input.data, src, group=group)
+            if self._use_broadcast_waves([input], group):
+                # point-to-point ops require contiguous buffers:
+                data = input.data
+                tensor = data.contiguous()
+                self._broadcast_in_waves_([tensor], src)
+                if tensor is not data and self.rank != src:
+                    data.copy_(tensor)
+            else:
+                dist.broadcast(input.data, src, group=group)
         return input
 
+    def _use_broadcast_waves(self, tensors, group):
+        # only depends on properties that all parties share, so that all parties
+        # take the same path:
+        return (
+            group is self.main_group
+            and self.get_world_size() > self.BROADCAST_WAVE_SIZE
+            and all(tensor.device.type == self._p2p_device_type for tensor in tensors)
+        )
+
+    def _broadcast_in_waves_(self, tensors, src):
+        """
+        In-place broadcast in which `src` sends to at most `BROADCAST_WAVE_SIZE`
+        parties at a time, to avoid congesting its links in large worlds.
+
+        Parties are served round-robin starting after `src`, so that concurrent
+        broadcasts from different sources address different parties first.
+        """
+        if self.rank != src:
+            reqs = [
+                dist.irecv(tensor, src=src, group=self.main_group)
+                for tensor in tensors
+            ]
+            for req in reqs:
+                req.wait()
+            return
+
+        world_size = self.get_world_size()
+        peers = [(src + offset) % world_size for offset in range(1, world_size)]
+        for start in range(0, len(peers), self.BROADCAST_WAVE_SIZE):
+            reqs = [
+                dist.isend(tensor, peer, group=self.main_group)
+                for peer in peers[start : start + self.BROADCAST_WAVE_SIZE]
+                for tensor in tensors
+            ]
+            for req in reqs:
+                req.wait()
+
     @_logging
     def barrier(self):
         """Synchronizes all processes.
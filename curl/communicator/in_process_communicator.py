@@ -11,14 +11,24 @@ from operator import itemgetter
 from queue import Queue
 
 import torch
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 from torch.distributed import ReduceOp
 
-from .communicator import Communicator
+from .communicator import _bucket_by_type, Communicator
 
 
 class InProcessCommunicator(Communicator):
 
-    BYTES_PER_ELEMENT = 8
+    # collectives that return their input when there is only a single party:
+    SINGLE_PARTY_METHODS = [
+        "scatter",
+        "reduce",
+        "all_reduce",
+        "all_reduce_coalesced",
+        "gather",
+        "all_gather",
+        "broadcast",
+    ]
     tls = threading.local()
     mailbox = None
     barrier = None
@@ -44,14 +54,19 @@ class InProcessCommunicator(Communicator):
                 # multiple puts that would show up in the get calls below
                 InProcessCommunicator.barrier = threading.Barrier(self.world_size)
 
+        # a single party does not need to communicate, but results must not
+        # alias inputs as they do not with multiple parties:
+        if self.world_size < 2:
+            self._bind_single_party(self.SINGLE_PARTY_METHODS, copy=True)
+
         # logging:
         level = logging.getLogger().level
         logging.getLogger().setLevel(logging.INFO)
         logging.info("==================")
-        logging.info("InProcessCommunicator with rank %d" % self.rank)
+        logging.info("InProcessCommunicator with rank %d", self.rank)
         logging.info("==================")
 
-        logging.info("World size = %d" % self.get_world_size())
+        logging.info("World size = %d", self.get_world_size())
         logging.getLogger().setLevel(level)
 
     @classmethod
@@ -76,6 +91,14 @@ class InProcessCommunicator(Communicator):
             raise NotImplementedError("Can't receive messages out of order yet")
         return result
 
+    def send_coalesced(self, tensors, dst):
+        """Sends a list of tensors to the destination dst in a single message."""
+        self.mailbox[dst].put((self.rank, [tensor.clone() for tensor in tensors]))
+
+    def recv_coalesced(self, tensors, src=None):
+        """Receives a list of tensors sent via `send_coalesced` from src."""
+        return self.recv(tensors, src=src)
+
     def isend(self, tensor, dst):
         """Sends the specified tensor to the destination dst."""
         self.send(tensor, dst)
@@ -151,6 +174,19 @@ class InProcessCommunicator(Communicator):
         reduce_fn = self._reduce_op_to_function(op)
         return reduce_fn(torch.stack(ag), dim=0)
 
+    def all_reduce_coalesced(self, tensors, op=ReduceOp.SUM):
+        """
+        Reduces a list of tensors across all parties, with one round per
+        (dtype, device) bucket.
+        """
+        results = [None] * len(tensors)
+        for indices in _bucket_by_type(tensors):
+            bucket = [tensors[idx] for idx in indices]
+            flat = self.all_reduce(_flatten_dense_tensors(bucket), op=op)
+            for idx, result in zip(indices, _unflatten_dense_tensors(flat, bucket)):
+                results[idx] = result
+        return results
+
     def gather(self, tensor, dst, async_op=False):
         """Gathers a list of tensors in a single party."""
         if async_op:
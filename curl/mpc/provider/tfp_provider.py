@@ -14,11 +14,29 @@ from curl.mpc.primitives import ArithmeticSharedTensor, BinarySharedTensor
 from .provider import TupleProvider
 
 
+def _output_size(op, size0, size1, *args, **kwargs):
+    """Returns the size of the result of `op` on tensors of the given sizes."""
+    x = torch.empty(size0, device="meta")
+    y = torch.empty(size1, device="meta")
+    return getattr(torch, op)(x, y, *args, **kwargs).size()
+
+
 class TrustedFirstParty(TupleProvider):
     NAME = "TFP"
 
+    # NOTE: only party 0 samples the tuples in the clear. The other parties only
+    # need the sizes of the tuples to generate their shares, so they skip the
+    # random sampling and the computation on the random values.
+
     def generate_additive_triple(self, size0, size1, op, device=None, *args, **kwargs):
         """Generate multiplicative triples of given sizes"""
+        if self.rank != 0:
+            size2 = _output_size(op, size0, size1, *args, **kwargs)
+            a = ArithmeticSharedTensor(size=size0, precision=0, src=0, device=device)
+            b = ArithmeticSharedTensor(size=size1, precision=0, src=0, device=device)
+            c = ArithmeticSharedTensor(size=size2, precision=0, src=0, device=device)
+            return a, b, c
+
         a = generate_random_ring_element(size0, device=device)
         b = generate_random_ring_element(size1, device=device)
 
@@ -32,6 +50,13 @@ class TrustedFirstParty(TupleProvider):
 
     def square(self, size, device=None):
         """Generate square double of given size"""
+        if self.rank != 0:
+            stacked_size = (2,) + tuple(size)
+            stacked = ArithmeticSharedTensor(
+                size=stacked_size, precision=0, src=0, device=device
+            )
+            return stacked[0], stacked[1]
+
         r = generate_random_ring_element(size, device=device)
         r2 = r.mul(r)
 
@@ -42,6 +67,13 @@ class TrustedFirstParty(TupleProvider):
 
     def generate_binary_triple(self, size0, size1, device=None):
         """Generate xor triples of given size"""
+        if self.rank != 0:
+            size2 = torch.broadcast_shapes(size0, size1)
+            a = BinarySharedTensor(size=size0, src=0, device=device)
+            b = BinarySharedTensor(size=size1, src=0, device=device)
+            c = BinarySharedTensor(size=size2, src=0, device=device)
+            return a, b, c
+
         a = generate_kbit_random_tensor(size0, device=device)
         b = generate_kbit_random_tensor(size1, device=device)
         c = a & b
@@ -96,6 +128,11 @@ class TrustedFirstParty(TupleProvider):
         Generate random shared tensors for the [EGK+20] probabilistic
         truncation protocol.
         """
+        if self.rank != 0:
+            return tuple(
+                ArithmeticSharedTensor(size=size, precision=0, src=0, device=device)
+                for _ in range(3)
+            )
 
         r = generate_kbit_random_tensor(size, l-m, device=device)
         r_shares = ArithmeticSharedTensor(r, precision=0, src=0)
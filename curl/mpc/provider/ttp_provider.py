@@ -182,7 +182,7 @@ class TTPClient:
             self.ttp_group = comm.get().ttp_group
             self.comm_group = comm.get().ttp_comm_group
             self._setup_generators()
-            logging.info(f"TTPClient {comm.get().get_rank()} initialized")
+            logging.info("TTPClient %d initialized", comm.get().get_rank())
 
         def _setup_generators(self):
             """Setup RNG generator shared between each party (client) and the TTPServer"""
@@ -268,7 +268,7 @@ class TTPServer:
             env_vars[key.lower()] = os.environ[key.upper()]
 
         logging.info("TTPServer: before crypten init.")
-        logging.info(f"TTPServer: env: {env_vars}")
+        logging.info("TTPServer: env: %s", env_vars)
         curl.init()
         logging.info("TTPServer: crypten init done.")
 
@@ -284,7 +284,7 @@ class TTPServer:
             while True:
                 # Wait for next request from client
                 message = comm.get().recv_obj(0, self.ttp_group)
-                logging.info("Message received: %s" % message)
+                logging.info("Message received: %s", message)
 
                 if message == "terminate":
                     logging.info("TTPServer shutting down.")
@@ -303,7 +303,7 @@ class TTPServer:
                 comm.get().broadcast(result, ttp_rank, self.comm_group)
         except RuntimeError as err:
             logging.info("Encountered Runtime error. TTPServer shutting down:")
-            logging.info(f"{err}")
+            logging.info("%s", err)
 
     def _setup_generators(self):
         """Create random generator to send to a party"""
@@ -28,6 +28,7 @@ from .module import (
     Conv,
     Conv1d,
     Conv2d,
+    ConvReluPool2d,
     Div,
     Dropout,
     Dropout2d,
@@ -105,6 +106,7 @@ __all__ = [  # noqa: F405
     "Conv",
     "Conv1d",
     "Conv2d",
+    "ConvReluPool2d",
     "CosineSimilarity",
     "CrossEntropyLoss",
     "Div",
@@ -653,14 +653,67 @@ class Graph(Container):
             self._graph[name] = input_names
         if output_names is not None:
             module._output_names = output_names
+        self._schedule = None
 
     def forward(self, *args):
         assert len(args) == len(
             self.input_names
         ), f"Expected {len(self.input_names)} inputs but received {len(args)}."
 
-        # keep track of all values that have been computed:
+        # run the modules in the order determined by the schedule:
         values = {self.input_names[idx]: args[idx] for idx in range(len(args))}
+        for node, input_names, output_names, release in self._get_schedule():
+
+            # compute output of module:
+            input = [values[name] for name in input_names]
+            if len(input) == 1:
+                input = input[0]  # unpack iterable if possible
+            module = self._modules[node]
+            output = module(input)
+
+            # we may get one output:
+            if output_names is None:
+                values[node] = output
+
+            # or multiple outputs:
+            else:
+                assert isinstance(
+                    output, tuple
+                ), f"expected outputs {output_names} of {module} to be tuple, not {type(output)}"
+                assert len(output_names) == len(
+                    output
+                ), f"expected {len(output_names)} outputs from {module}, received {len(output)}"
+                for name, value in zip(output_names, output):
+                    values[name] = value
+
+            # clean up values we no longer need (to save memory):
+            for name in release:
+                del values[name]
+
+        result = [values[output_name] for output_name in self.output_names]
+        return result[0] if len(result) == 1 else tuple(result)
+
+    def _get_schedule(self):
+        """
+        Returns the schedule used by `forward`, computing it if the graph or its
+        inputs and outputs changed since it was last computed.
+        """
+        key = (tuple(self.input_names), tuple(self.output_names))
+        schedule = getattr(self, "_schedule", None)
+        if schedule is None or schedule[0] != key:
+            schedule = (key, self._compute_schedule())
+            self._schedule = schedule
+        return schedule[1]
+
+    def _compute_schedule(self):
+        """
+        Statically determines the order in which `forward` computes modules.
+
+        Returns a list of `(node, input_names, output_names, release)` tuples,
+        where `output_names` is `None` for modules that produce a single output
+        and `release` lists the values that are no longer needed once the
+        module has been computed.
+        """
         computed = {key: False for key in self._graph.keys()}
         inputs_available = {
             key: [False for _ in range(len(value_list))]
@@ -681,70 +734,51 @@ class Graph(Container):
                     return key
             return None
 
-        def _clear_unused_values():
-            """Clear values that are no longer needed (to save memory)."""
-            remove_keys = []
-            for remove_key in values.keys():
-                can_be_removed = True
-
-                # we cannot remove a value if it is still needed:
-                for key, value_list in self._graph.items():
-                    if not computed[key] and remove_key in value_list:
-                        can_be_removed = False
-                        break
-                if can_be_removed:
-                    remove_keys.append(remove_key)
-
-            # remove all values we no longer need:
-            for remove_key in remove_keys:
-                del values[remove_key]
-            # NOTE: We maintain inputs_available[remove_key] as True to
-            # prevent re-computation of the node.
-
-        # perform forward pass:
+        def _is_needed(name):
+            """Checks whether a value is still needed by the graph."""
+            if name in self.output_names:
+                return True
+            return any(
+                not computed[key] and name in value_list
+                for key, value_list in self._graph.items()
+            )
+
+        # simulate the forward pass:
+        schedule = []
+        live_values = list(self.input_names)
         for input_name in self.input_names:
             _mark_as_computed(input_name)
         node_to_compute = _find_computable_node()
         while node_to_compute is not None:
-
-            # compute output of module:
-            input = [values[name] for name in self._graph[node_to_compute]]
-            if len(input) == 1:
-                input = input[0]  # unpack iterable if possible
             module = self._modules[node_to_compute]
-            output = module(input)
 
-            # we may get one output:
+            # we may get one output, or multiple outputs:
             output_names = getattr(module, "_output_names", None)
             if output_names is None or len(output_names) == 1:
                 if output_names is not None:
                     assert output_names[0] == node_to_compute, "invalid graph"
-                values[node_to_compute] = output
-                _mark_as_computed(node_to_compute)
-
-            # or multiple outputs:
+                output_names = None
+                produced = [node_to_compute]
             else:
-                assert isinstance(
-                    output, tuple
-                ), f"expected outputs {output_names} of {module} to be tuple, not {type(output)}"
-                assert len(output_names) == len(
-                    output
-                ), f"expected {len(output_names)} outputs from {module}, received {len(output)}"
-                for node, value in zip(output_names, output):
-                    values[node] = value
-                    _mark_as_computed(node)
+                produced = list(output_names)
+            for name in produced:
+                _mark_as_computed(name)
+            assert computed[node_to_compute], "invalid graph"
+            live_values.extend(name for name in produced if name not in live_values)
+
+            release = [name for name in live_values if not _is_needed(name)]
+            live_values = [name for name in live_values if name not in release]
+            schedule.append(
+                (node_to_compute, self._graph[node_to_compute], output_names, release)
+            )
 
-            # return output if it is available:
+            # schedule is complete once all outputs are available:
             if all(computed[output_name] for output_name in self.output_names):
-                result = [values[output_name] for output_name in self.output_names]
-                return result[0] if len(result) == 1 else tuple(result)
+                return schedule
 
             # find next node to compute:
             node_to_compute = _find_computable_node()
 
-            # clean up values we no longer need:
-            _clear_unused_values()
-
         # this should never happen:
         raise ValueError("nn.Graph.forward() failed. Is graph unconnected?")
 
@@ -2770,6 +2804,57 @@ class MaxPool2d(_Pool2d):
         return super(MaxPool2d, MaxPool2d).from_onnx("max", attributes=attributes)
 
 
+class ConvReluPool2d(Conv2d):
+    r"""
+    Module that performs a 2D convolution (see :meth:`Conv2d`), followed by a
+    ReLU and 2D max pooling (see :meth:`MaxPool2d`).
+
+    Because ReLU is monotonic, it commutes with max pooling:
+    :math:`\text{MaxPool}(\text{ReLU}(x)) = \text{ReLU}(\text{MaxPool}(x))`.
+    The module pools before applying the ReLU, so the secret-shared comparison
+    of the ReLU is evaluated on the pooled output only. With the default
+    :math:`2 \times 2` pooling that is a quarter of the elements.
+
+    Args:
+        in_channels (int): Number of channels in the input image
+        out_channels (int): Number of channels produced by the convolution
+        kernel_size (int or tuple): Size of the convolving kernel
+        pool_kernel_size (int): Size of the pooling window. Default: 2
+        pool_stride (int, optional): Stride of the pooling window. Default
+        value is :attr:`pool_kernel_size`
+        stride, padding, dilation, groups, bias: see :meth:`Conv2d`
+    """
+
+    def __init__(
+        self,
+        in_channels,
+        out_channels,
+        kernel_size,
+        pool_kernel_size=2,
+        pool_stride=None,
+        stride=1,
+        padding=0,
+        dilation=1,
+        groups=1,
+        bias=True,
+    ):
+        super().__init__(
+            in_channels,
+            out_channels,
+            kernel_size,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=groups,
+            bias=bias,
+        )
+        self.pool = MaxPool2d(pool_kernel_size, stride=pool_stride)
+
+    def forward(self, x):
+        x = super().forward(x)
+        return self.pool(x).relu()
+
+
 class AdaptiveAvgPool2d(Module):
     r"""Applies a 2D adaptive average pooling over an input signal composed of several input planes.
 
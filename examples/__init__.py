@@ -5,7 +5,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from .meters import AccuracyMeter, AverageMeter
+from .meters import AccuracyMeter, AverageMeter, TensorMeter
 from .multiprocess_launcher import MultiProcessLauncher
 from .util import NoopContextManager
 
@@ -13,6 +13,7 @@ from .util import NoopContextManager
 __all__ = [
     "AverageMeter",
     "AccuracyMeter",
+    "TensorMeter",
     "NoopContextManager",
     "MultiProcessLauncher",
 ]
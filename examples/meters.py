@@ -26,6 +26,31 @@ class AverageMeter:
         return self.sum / self.count
 
 
+class TensorMeter:
+    """
+    Measures average of a tensor value. The sum is kept on the device of the
+    values, so adding values does not synchronize with that device.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sum = None
+        self.count = 0
+
+    def add(self, value, n=1):
+        value = value.detach() * n
+        if self.sum is None:
+            self.sum = value
+        else:
+            self.sum.add_(value)
+        self.count += n
+
+    def value(self):
+        return (self.sum / self.count).item()
+
+
 class AccuracyMeter:
     """Measures top-k accuracy of multi-class predictions."""
 
@@ -118,6 +118,18 @@ parser.add_argument(
     action="store_true",
     help="Skip validation for plaintext network",
 )
+parser.add_argument(
+    "--compile-plaintext",
+    default=False,
+    action="store_true",
+    help="Compile the plaintext network with torch.compile for validation",
+)
+parser.add_argument(
+    "--prefer-strided",
+    default=False,
+    action="store_true",
+    help="Evaluate a strided LeNet distilled from the network privately",
+)
 parser.add_argument(
     "--multiprocess",
     default=False,
@@ -148,6 +160,8 @@ def _run_experiment(args):
         args.evaluate,
         args.seed,
         args.skip_plaintext,
+        compile_plaintext=args.compile_plaintext,
+        prefer_strided=args.prefer_strided,
     )
 
 
@@ -5,12 +5,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
 import logging
 import os
 import random
 import shutil
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import curl
 import curl.communicator as comm
@@ -20,7 +22,7 @@ import torch.nn.functional as F
 import torch.optim
 import torch.utils.data
 import torch.utils.data.distributed
-from examples.meters import AverageMeter
+from examples.meters import AverageMeter, TensorMeter
 from examples.util import NoopContextManager
 from torchvision import datasets, transforms
 
@@ -39,12 +41,19 @@ def run_mpc_cifar(
     seed=None,
     skip_plaintext=False,
     context_manager=None,
+    compile_plaintext=False,
+    prefer_strided=False,
 ):
+    if prefer_strided and not evaluate:
+        raise ValueError("prefer_strided only applies when evaluating the model")
+
     if seed is not None:
         random.seed(seed)
         torch.manual_seed(seed)
 
     curl.init()
+    rank = comm.get().get_rank()
+    world_size = comm.get().get_world_size()
 
     # create model
     model = LeNet()
@@ -58,16 +67,16 @@ def run_mpc_cifar(
     best_prec1 = 0
     if resume:
         if os.path.isfile(model_location):
-            logging.info("=> loading checkpoint '{}'".format(model_location))
+            logging.info("=> loading checkpoint '%s'", model_location)
             checkpoint = torch.load(model_location)
             start_epoch = checkpoint["epoch"]
             best_prec1 = checkpoint["best_prec1"]
             model.load_state_dict(checkpoint["state_dict"])
             optimizer.load_state_dict(checkpoint["optimizer"])
             logging.info(
-                "=> loaded checkpoint '{}' (epoch {})".format(
-                    model_location, checkpoint["epoch"]
-                )
+                "=> loaded checkpoint '%s' (epoch %d)",
+                model_location,
+                checkpoint["epoch"],
             )
         else:
             raise IOError("=> no checkpoint found at '{}'".format(model_location))
@@ -87,11 +96,19 @@ def run_mpc_cifar(
             testset = datasets.CIFAR10(
                 data_dirname, train=False, download=True, transform=transform
             )
+        # pinned memory lets host-to-device copies overlap with compute, and
+        # persistent workers avoid respawning workers for every epoch:
+        loader_kwargs = {
+            "num_workers": 2,
+            "pin_memory": torch.cuda.is_available(),
+            "persistent_workers": True,
+            "prefetch_factor": 4,
+        }
         trainloader = torch.utils.data.DataLoader(
-            trainset, batch_size=4, shuffle=True, num_workers=2
+            trainset, batch_size=4, shuffle=True, **loader_kwargs
         )
         testloader = torch.utils.data.DataLoader(
-            testset, batch_size=batch_size, shuffle=False, num_workers=2
+            testset, batch_size=batch_size, shuffle=False, **loader_kwargs
         )
         return trainloader, testloader
 
@@ -104,29 +121,61 @@ def run_mpc_cifar(
     if evaluate:
         if not skip_plaintext:
             logging.info("===== Evaluating plaintext LeNet network =====")
-            validate(val_loader, model, criterion, print_freq)
+            plaintext_model = model
+            if compile_plaintext and hasattr(torch, "compile"):
+                # the private model is built from the uncompiled model below:
+                plaintext_model = torch.compile(
+                    model, mode="reduce-overhead", dynamic=False
+                )
+            validate(
+                val_loader, plaintext_model, criterion, rank, world_size, print_freq
+            )
+        if prefer_strided:
+            # only party 0 holds the actual model, so only it needs to distill:
+            logging.info("===== Distilling strided LeNet network =====")
+            if rank == 0:
+                model = distill_lenet_strided(model, train_loader)
+                if not skip_plaintext:
+                    logging.info("===== Evaluating plaintext strided LeNet =====")
+                    validate(
+                        val_loader, model, criterion, rank, world_size, print_freq
+                    )
+            else:
+                model = LeNetStrided()
         logging.info("===== Evaluating Private LeNet network =====")
         input_size = get_input_size(val_loader, batch_size)
-        private_model = construct_private_model(input_size, model)
-        validate(val_loader, private_model, criterion, print_freq)
+        private_model = construct_private_model(input_size, model, rank)
+        validate(val_loader, private_model, criterion, rank, world_size, print_freq)
         # logging.info("===== Validating side-by-side ======")
-        # validate_side_by_side(val_loader, model, private_model)
+        # validate_side_by_side(val_loader, model, private_model, rank, world_size)
         return
 
+    # learning rate decays by 10 every 5 epochs:
+    lr_schedule = [lr * (0.1 ** (epoch // 5)) for epoch in range(epochs)]
+
     # define loss function (criterion) and optimizer
+    checkpoint = None
     for epoch in range(start_epoch, epochs):
-        adjust_learning_rate(optimizer, epoch, lr)
+        # only party 0 saves checkpoints, so keep the parties in step per epoch
+        # (the barrier does not wait for the checkpoint to be written):
+        comm.get().barrier()
+        adjust_learning_rate(optimizer, epoch, lr_schedule)
 
         # train for one epoch
         train(train_loader, model, criterion, optimizer, epoch, print_freq)
 
         # evaluate on validation set
-        prec1 = validate(val_loader, model, criterion, print_freq)
+        prec1 = validate(val_loader, model, criterion, rank, world_size, print_freq)
 
         # remember best prec@1 and save checkpoint
         is_best = prec1 > best_prec1
         best_prec1 = max(prec1, best_prec1)
-        save_checkpoint(
+
+        # wait for the previous checkpoint, so that failures are raised and at
+        # most one copy of the state is waiting to be written:
+        if checkpoint is not None:
+            checkpoint.result()
+        checkpoint = save_checkpoint(
             {
                 "epoch": epoch + 1,
                 "arch": "LeNet",
@@ -135,22 +184,29 @@ def run_mpc_cifar(
                 "optimizer": optimizer.state_dict(),
             },
             is_best,
+            rank,
         )
+    if checkpoint is not None:
+        checkpoint.result()
     data_dir.cleanup()
 
 
 def train(train_loader, model, criterion, optimizer, epoch, print_freq=10):
     batch_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    losses = TensorMeter()
+    top1 = TensorMeter()
+    top5 = TensorMeter()
 
     # switch to train mode
     model.train()
+    device = next(model.parameters()).device
+    logger = logging.getLogger()
 
     end = time.time()
 
     for i, (input, target) in enumerate(train_loader):
+        input = input.to(device, non_blocking=True)
+        target = target.to(device, non_blocking=True)
 
         # compute output
         output = model(input)
@@ -158,7 +214,7 @@ def train(train_loader, model, criterion, optimizer, epoch, print_freq=10):
 
         # measure accuracy and record loss
         prec1, prec5 = accuracy(output, target, topk=(1, 5))
-        losses.add(loss.item(), input.size(0))
+        losses.add(loss, input.size(0))
         top1.add(prec1[0], input.size(0))
         top5.add(prec5[0], input.size(0))
 
@@ -172,29 +228,31 @@ def train(train_loader, model, criterion, optimizer, epoch, print_freq=10):
         batch_time.add(current_batch_time)
         end = time.time()
 
-        if i % print_freq == 0:
+        # the meters are only read when logging, as that syncs the device:
+        if i % print_freq == 0 and logger.isEnabledFor(logging.INFO):
             logging.info(
-                "Epoch: [{}][{}/{}]\t"
-                "Time {:.3f} ({:.3f})\t"
-                "Loss {:.4f} ({:.4f})\t"
-                "Prec@1 {:.3f} ({:.3f})\t"
-                "Prec@5 {:.3f} ({:.3f})".format(
-                    epoch,
-                    i,
-                    len(train_loader),
-                    current_batch_time,
-                    batch_time.value(),
-                    loss.item(),
-                    losses.value(),
-                    prec1[0],
-                    top1.value(),
-                    prec5[0],
-                    top5.value(),
-                )
+                "Epoch: [%d][%d/%d]\t"
+                "Time %.3f (%.3f)\t"
+                "Loss %.4f (%.4f)\t"
+                "Prec@1 %.3f (%.3f)\t"
+                "Prec@5 %.3f (%.3f)",
+                epoch,
+                i,
+                len(train_loader),
+                current_batch_time,
+                batch_time.value(),
+                loss.item(),
+                losses.value(),
+                prec1[0],
+                top1.value(),
+                prec5[0],
+                top5.value(),
             )
 
 
-def validate_side_by_side(val_loader, plaintext_model, private_model):
+def validate_side_by_side(
+    val_loader, plaintext_model, private_model, rank, world_size
+):
     """Validate the plaintext and private models side-by-side on each example"""
     # switch to evaluate mode
     plaintext_model.eval()
@@ -206,13 +264,13 @@ def validate_side_by_side(val_loader, plaintext_model, private_model):
             output_plaintext = plaintext_model(input)
             # encrypt input and compute output for private
             # assumes that private model is encrypted with src=0
-            input_encr = encrypt_data_tensor_with_src(input)
+            input_encr = encrypt_data_tensor_with_src(input, rank, world_size)
             output_encr = private_model(input_encr)
             # log all info
             logging.info("==============================")
-            logging.info("Example %d\t target = %d" % (i, target))
-            logging.info("Plaintext:\n%s" % output_plaintext)
-            logging.info("Encrypted:\n%s\n" % output_encr.get_plain_text())
+            logging.info("Example %d\t target = %d", i, target)
+            logging.info("Plaintext:\n%s", output_plaintext)
+            logging.info("Encrypted:\n%s\n", output_encr.get_plain_text())
             # only use the first 1000 examples
             if i > 1000:
                 break
@@ -223,28 +281,25 @@ def get_input_size(val_loader, batch_size):
     return input.size()
 
 
-def construct_private_model(input_size, model):
+def construct_private_model(input_size, model, rank):
     """Encrypt and validate trained model for multi-party setting."""
-    # get rank of current process
-    rank = comm.get().get_rank()
     dummy_input = torch.empty(input_size)
 
     # party 0 always gets the actual model; remaining parties get dummy model
     if rank == 0:
         model_upd = model
     else:
-        model_upd = LeNet()
+        model_upd = type(model)()
     private_model = curl.nn.from_pytorch(model_upd, dummy_input).encrypt(src=0)
     return private_model
 
 
-def encrypt_data_tensor_with_src(input):
-    """Encrypt data tensor for multi-party setting"""
-    # get rank of current process
-    rank = comm.get().get_rank()
-    # get world size
-    world_size = comm.get().get_world_size()
+# dummy inputs of non-source parties, keyed by size and dtype:
+_dummy_inputs = {}
+
 
+def encrypt_data_tensor_with_src(input, rank, world_size):
+    """Encrypt data tensor for multi-party setting"""
     if world_size > 1:
         # party 1 gets the actual tensor; remaining parties get dummy tensor
         src_id = 1
@@ -255,27 +310,38 @@ def encrypt_data_tensor_with_src(input):
     if rank == src_id:
         input_upd = input
     else:
-        input_upd = torch.empty(input.size())
+        # only the size of the dummy tensor matters, so reuse it across batches:
+        key = (input.size(), input.dtype)
+        if key not in _dummy_inputs:
+            _dummy_inputs[key] = torch.empty(input.size(), dtype=input.dtype)
+        input_upd = _dummy_inputs[key]
     private_input = curl.cryptensor(input_upd, src=src_id)
     return private_input
 
 
-def validate(val_loader, model, criterion, print_freq=10):
+def validate(val_loader, model, criterion, rank, world_size, print_freq=10):
     batch_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    losses = TensorMeter()
+    top1 = TensorMeter()
+    top5 = TensorMeter()
 
     # switch to evaluate mode
     model.eval()
 
+    # plaintext models take their inputs on the device of their parameters:
+    device = None
+    if not isinstance(model, curl.nn.Module):
+        device = next(model.parameters()).device
+    logger = logging.getLogger()
+
     with torch.no_grad():
         end = time.time()
         for i, (input, target) in enumerate(val_loader):
-            if isinstance(model, curl.nn.Module) and not curl.is_encrypted_tensor(
-                input
-            ):
-                input = encrypt_data_tensor_with_src(input)
+            if device is not None:
+                input = input.to(device, non_blocking=True)
+                target = target.to(device, non_blocking=True)
+            elif not curl.is_encrypted_tensor(input):
+                input = encrypt_data_tensor_with_src(input, rank, world_size)
             # compute output
             output = model(input)
             if curl.is_encrypted_tensor(output):
@@ -284,7 +350,7 @@ def validate(val_loader, model, criterion, print_freq=10):
 
             # measure accuracy and record loss
             prec1, prec5 = accuracy(output, target, topk=(1, 5))
-            losses.add(loss.item(), input.size(0))
+            losses.add(loss, input.size(0))
             top1.add(prec1[0], input.size(0))
             top5.add(prec5[0], input.size(0))
 
@@ -293,45 +359,57 @@ def validate(val_loader, model, criterion, print_freq=10):
             batch_time.add(current_batch_time)
             end = time.time()
 
-            if (i + 1) % print_freq == 0:
+            # the meters are only read when logging, as that syncs the device:
+            if (i + 1) % print_freq == 0 and logger.isEnabledFor(logging.INFO):
                 logging.info(
-                    "\nTest: [{}/{}]\t"
-                    "Time {:.3f} ({:.3f})\t"
-                    "Loss {:.4f} ({:.4f})\t"
-                    "Prec@1 {:.3f} ({:.3f})   \t"
-                    "Prec@5 {:.3f} ({:.3f})".format(
-                        i + 1,
-                        len(val_loader),
-                        current_batch_time,
-                        batch_time.value(),
-                        loss.item(),
-                        losses.value(),
-                        prec1[0],
-                        top1.value(),
-                        prec5[0],
-                        top5.value(),
-                    )
+                    "\nTest: [%d/%d]\t"
+                    "Time %.3f (%.3f)\t"
+                    "Loss %.4f (%.4f)\t"
+                    "Prec@1 %.3f (%.3f)   \t"
+                    "Prec@5 %.3f (%.3f)",
+                    i + 1,
+                    len(val_loader),
+                    current_batch_time,
+                    batch_time.value(),
+                    loss.item(),
+                    losses.value(),
+                    prec1[0],
+                    top1.value(),
+                    prec5[0],
+                    top5.value(),
                 )
 
-        logging.info(
-            " * Prec@1 {:.3f} Prec@5 {:.3f}".format(top1.value(), top5.value())
-        )
+        logging.info(" * Prec@1 %.3f Prec@5 %.3f", top1.value(), top5.value())
     return top1.value()
 
 
-def save_checkpoint(state, is_best, filename="checkpoint.pth.tar"):
-    """Saves checkpoint of plaintext model"""
+_checkpoint_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def save_checkpoint(state, is_best, rank, filename="checkpoint.pth.tar"):
+    """
+    Saves checkpoint of plaintext model in the background. Returns a future
+    that completes when the checkpoint is written, or None if this process
+    does not save checkpoints.
+    """
     # only save from rank 0 process to avoid race condition
-    rank = comm.get().get_rank()
-    if rank == 0:
-        torch.save(state, filename)
-        if is_best:
-            shutil.copyfile(filename, "model_best.pth.tar")
+    if rank != 0:
+        return None
+
+    # copy the state so that training can update the model during the save:
+    state = copy.deepcopy(state)
+    return _checkpoint_executor.submit(_write_checkpoint, state, is_best, filename)
 
 
-def adjust_learning_rate(optimizer, epoch, lr=0.01):
-    """Sets the learning rate to the initial LR decayed by 10 every 30 epochs"""
-    new_lr = lr * (0.1 ** (epoch // 5))
+def _write_checkpoint(state, is_best, filename):
+    torch.save(state, filename)
+    if is_best:
+        shutil.copyfile(filename, "model_best.pth.tar")
+
+
+def adjust_learning_rate(optimizer, epoch, lr_schedule):
+    """Sets the learning rate to its value in the precomputed schedule"""
+    new_lr = lr_schedule[epoch]
     for param_group in optimizer.param_groups:
         param_group["lr"] = new_lr
 
@@ -344,13 +422,12 @@ def accuracy(output, target, topk=(1,)):
 
         _, pred = output.topk(maxk, 1, True, True)
         pred = pred.t()
-        correct = pred.eq(target.view(1, -1).expand_as(pred))
+        correct = pred.eq(target.view(1, -1).expand_as(pred)).float()
 
-        res = []
-        for k in topk:
-            correct_k = correct[:k].flatten().float().sum(0, keepdim=True)
-            res.append(correct_k.mul_(100.0 / batch_size))
-        return res
+        # row k - 1 of the cumulative sum marks whether the target is in the top-k:
+        correct_k = correct.cumsum(dim=0)[[k - 1 for k in topk]]
+        res = correct_k.sum(dim=1, keepdim=True).mul_(100.0 / batch_size)
+        return list(res)
 
 
 class LeNet(nn.Sequential):
@@ -369,10 +446,66 @@ class LeNet(nn.Sequential):
         self.fc3 = nn.Linear(84, 10)
 
     def forward(self, x):
-        x = self.pool(F.relu(self.conv1(x)))
-        x = self.pool(F.relu(self.conv2(x)))
+        # max pooling commutes with ReLU; pooling first means the private model
+        # evaluates the ReLU comparisons on a quarter of the elements:
+        x = F.relu(self.pool(self.conv1(x)))
+        x = F.relu(self.pool(self.conv2(x)))
+        x = x.view(-1, 16 * 5 * 5)
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        x = self.fc3(x)
+        return x
+
+
+class LeNetStrided(nn.Sequential):
+    """
+    Adaptation of LeNet that downsamples with strided convolutions instead of
+    max pooling, which avoids the comparisons of max pooling in the private
+    model. It has the same parameters as LeNet.
+    """
+
+    # network architecture:
+    def __init__(self):
+        super(LeNetStrided, self).__init__()
+        self.conv1 = nn.Conv2d(3, 6, 5, stride=2)
+        self.conv2 = nn.Conv2d(6, 16, 5, stride=2)
+        self.fc1 = nn.Linear(16 * 5 * 5, 120)
+        self.fc2 = nn.Linear(120, 84)
+        self.fc3 = nn.Linear(84, 10)
+
+    def forward(self, x):
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
         x = x.view(-1, 16 * 5 * 5)
         x = F.relu(self.fc1(x))
         x = F.relu(self.fc2(x))
         x = self.fc3(x)
         return x
+
+
+def distill_lenet_strided(model, train_loader, epochs=1, lr=0.001, momentum=0.9):
+    """
+    Distills a trained LeNet into a LeNetStrided, starting from its parameters
+    and training to match its predicted class probabilities.
+    """
+    student = LeNetStrided()
+    student.load_state_dict(model.state_dict())
+    device = next(model.parameters()).device
+    student.to(device)
+    optimizer = torch.optim.SGD(student.parameters(), lr=lr, momentum=momentum)
+
+    model.eval()
+    student.train()
+    for _ in range(epochs):
+        for input, _ in train_loader:
+            input = input.to(device, non_blocking=True)
+            with torch.no_grad():
+                target = F.softmax(model(input), dim=1)
+            output = F.log_softmax(student(input), dim=1)
+            loss = F.kl_div(output, target, reduction="batchmean")
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    student.eval()
+    return student
@@ -5,6 +5,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import threading
 import unittest
 
 import curl
@@ -15,6 +16,7 @@ import torch.distributed as dist
 import torch.nn as nn
 import torch.nn.functional as F
 from curl.common import serial
+from curl.communicator import InProcessCommunicator
 from curl.config import cfg
 from test.multiprocess_test_case import get_random_test_tensor, MultiProcessTestCase
 
@@ -83,6 +85,17 @@ class TestCommunicator:
             result = comm.get().all_reduce(tensor)
             self.assertTrue((result == (tensor * self.world_size)).all())
 
+    def test_all_reduce_large(self) -> None:
+        # large enough to use the backend's all-reduce instead of recursive doubling
+        tensor = get_random_test_tensor(size=(64, 1024))
+        result = comm.get().all_reduce(tensor)
+        self.assertTrue((result == (tensor * self.world_size)).all())
+
+    def test_all_reduce_non_contiguous(self) -> None:
+        tensor = get_random_test_tensor(size=(5, 3)).t()
+        result = comm.get().all_reduce(tensor)
+        self.assertTrue((result == (tensor * self.world_size)).all())
+
     def test_gather(self) -> None:
         tensor = torch.tensor([self.rank])
         for rank in range(self.world_size):
@@ -143,6 +156,28 @@ class TestCommunicator:
             self.assertTrue(torch.is_tensor(tensor))
             self.assertEqual(tensor.item(), 1)
 
+    def test_verbosity(self) -> None:
+        tensor = get_random_test_tensor(size=(5,))
+
+        # communication stats are only logged while verbose:
+        for verbose in [True, False]:
+            comm.get().set_verbosity(verbose)
+            curl.reset_communication_stats()
+            comm.get().all_reduce(tensor)
+            stats = comm.get().get_communication_stats()
+            self.assertEqual(stats["rounds"], 1 if verbose else 0)
+            self.assertEqual(stats["bytes"], tensor.numel() * 8 if verbose else 0)
+            if not verbose:
+                self.assertEqual(stats["time"], 0)
+
+        # bytes are counted according to the width of the dtype:
+        comm.get().set_verbosity(True)
+        curl.reset_communication_stats()
+        comm.get().all_reduce(tensor.float())
+        stats = comm.get().get_communication_stats()
+        self.assertEqual(stats["bytes"], tensor.numel() * 4)
+        comm.get().set_verbosity(False)
+
     def test_get_world_size(self) -> None:
         self.assertEqual(comm.get().get_world_size(), self.world_size)
 
@@ -158,6 +193,37 @@ class TestCommunicator:
         for i, result in enumerate(results):
             self.assertTrue((result == (tensors[i] * self.world_size)).all())
 
+    def test_all_reduce_coalesced(self) -> None:
+        sizes = [(), (1,), (5,), (5, 5), (5, 5, 5)]
+        tensors = [get_random_test_tensor(size=size) for size in sizes]
+        tensors.append(get_random_test_tensor(size=(3,), is_float=True))
+
+        results = comm.get().all_reduce_coalesced(tensors)
+        self.assertTrue(isinstance(results, list))
+        for i, result in enumerate(results):
+            self.assertEqual(result.size(), tensors[i].size())
+            self.assertEqual(result.dtype, tensors[i].dtype)
+            self.assertTrue((result == (tensors[i] * self.world_size)).all())
+
+    def test_send_recv_coalesced(self) -> None:
+        sizes = [(), (1,), (5,), (5, 5), (5, 5, 5)]
+        tensors = [torch.full(size, self.rank, dtype=torch.long) for size in sizes]
+
+        # Send forward, receive backward
+        dst = (self.rank + 1) % self.world_size
+        src = (self.rank - 1) % self.world_size
+
+        if self.rank == 0:
+            comm.get().send_coalesced(tensors, dst=dst)
+        results = comm.get().recv_coalesced(tensors, src=src)
+        if self.rank > 0:
+            comm.get().send_coalesced(tensors, dst=dst)
+
+        self.assertTrue(isinstance(results, list))
+        for i, result in enumerate(results):
+            self.assertEqual(result.size(), tensors[i].size())
+            self.assertTrue(result.eq(src).all())
+
     def test_batched_reduce(self) -> None:
         sizes = [(), (1,), (5,), (5, 5), (5, 5, 5)]
         for rank in range(self.world_size):
@@ -186,6 +252,19 @@ class TestCommunicator:
                 self.assertTrue(torch.is_tensor(tensor))
                 self.assertTrue(tensor.eq(1).all())
 
+        # mixed dtypes and non-contiguous tensors:
+        for rank in range(self.world_size):
+            value = 1 if self.rank == rank else 0
+            tensors = [
+                torch.full((5,), float(value)),
+                torch.full((5, 5), value, dtype=torch.long).t(),
+                torch.full((3,), value, dtype=torch.long),
+            ]
+            results = comm.get().broadcast(tensors, rank, batched=True)
+            for tensor, result in zip(tensors, results):
+                self.assertEqual(result.dtype, tensor.dtype)
+                self.assertTrue(result.eq(1).all())
+
     def test_send_recv_obj(self) -> None:
         TEST_OBJECTS = [
             {"a": 1, "b": 2, "c": 3},
@@ -385,6 +464,175 @@ class TestCommunicatorMultiProcess(TestCommunicator, MultiProcessTestCase):
         self.assertEqual(comm.get().comm_bytes, 0)
 
 
+class TestSingleParty(MultiProcessTestCase):
+    def setUp(self) -> None:
+        super().setUp(world_size=1)
+
+    def test_single_party(self) -> None:
+        tensor = torch.tensor([1, 2, 3])
+
+        # only the collectives are rebound, whichever the verbosity:
+        for verbose in [True, False, True]:
+            comm.get().set_verbosity(verbose)
+            curl.reset_communication_stats()
+
+            for name in comm.get().SINGLE_PARTY_METHODS:
+                self.assertIn(name, vars(comm.get()))
+            for name in ["send", "recv", "send_obj", "recv_obj", "barrier"]:
+                self.assertNotIn(name, vars(comm.get()))
+
+            results = {
+                "scatter": comm.get().scatter([tensor], 0),
+                "reduce": comm.get().reduce(tensor, 0),
+                "all_reduce": comm.get().all_reduce(tensor),
+                "broadcast": comm.get().broadcast(tensor, 0),
+            }
+            for name, result in results.items():
+                self.assertTrue(torch.is_tensor(result), name)
+                self.assertEqual(result.tolist(), [1, 2, 3], name)
+
+            results = {
+                "gather": comm.get().gather(tensor, 0),
+                "all_gather": comm.get().all_gather(tensor),
+            }
+            for name, result in results.items():
+                self.assertIsInstance(result, list, name)
+                self.assertEqual([x.tolist() for x in result], [[1, 2, 3]], name)
+
+            tensors = [tensor, tensor.float()]
+            result = comm.get().all_reduce(tensors, batched=True)
+            self.assertEqual([x.dtype for x in result], [torch.long, torch.float32])
+            result = comm.get().all_reduce_coalesced(tensors)
+            self.assertEqual([x.dtype for x in result], [torch.long, torch.float32])
+            result = comm.get().broadcast_obj({"key": 1}, 0)
+            self.assertEqual(result, {"key": 1})
+
+            # the rebound collectives do not communicate, the barrier does:
+            comm.get().barrier()
+            stats = comm.get().get_communication_stats()
+            self.assertEqual(stats["rounds"], 1 if verbose else 0)
+            self.assertEqual(stats["bytes"], 0)
+
+    def test_other_group(self) -> None:
+        # collectives in groups other than the main group, such as those shared
+        # with the TTP, still communicate:
+        group = dist.new_group([0])
+        comm.get().set_verbosity(True)
+        curl.reset_communication_stats()
+        tensor = torch.tensor([1, 2, 3])
+        result = comm.get().broadcast(tensor, 0, group)
+        self.assertEqual(result.tolist(), [1, 2, 3])
+        result = comm.get().broadcast_obj({"key": 1}, 0, group=group)
+        self.assertEqual(result, {"key": 1})
+        self.assertEqual(comm.get().get_communication_stats()["rounds"], 2)
+
+
+class TestBroadcastInWaves(MultiProcessTestCase):
+    def setUp(self) -> None:
+        # the source sends to one party at a time, so it takes several waves:
+        super().setUp(world_size=4)
+        if self.rank >= 0:
+            comm.get().BROADCAST_WAVE_SIZE = 1
+
+    def test_broadcast_in_waves(self) -> None:
+        self.assertGreater(self.world_size, comm.get().BROADCAST_WAVE_SIZE + 1)
+        sizes = [(), (1,), (5,), (5, 5)]
+        for src in range(self.world_size):
+            value = 1.0 if self.rank == src else 0.0
+            tensor = comm.get().broadcast(torch.tensor(value), src)
+            self.assertEqual(tensor.item(), 1)
+
+            tensors = [torch.full(size, value) for size in sizes]
+            tensors = comm.get().broadcast(tensors, src, batched=True)
+            for tensor in tensors:
+                self.assertTrue(tensor.eq(1).all())
+
+            # only the source provides a non-contiguous tensor:
+            if self.rank == src:
+                tensor = torch.arange(6.0).view(2, 3).t()
+            else:
+                tensor = torch.zeros(3, 2)
+            reference = torch.arange(6.0).view(2, 3).t()
+            result = comm.get().broadcast(tensor, src)
+            self.assertTrue(result.eq(reference).all())
+            result = comm.get().broadcast([tensor], src, batched=True)
+            self.assertTrue(result[0].eq(reference).all())
+
+
+class TestInProcessCommunicator(unittest.TestCase):
+    def test_all_reduce_coalesced(self) -> None:
+        world_size = 2
+        results = [None] * world_size
+
+        def run(rank):
+            InProcessCommunicator.initialize(rank, world_size)
+            tensors = [
+                torch.tensor([2**60 + rank]),
+                torch.tensor([1.5]),
+                torch.tensor([rank, 1]),
+            ]
+            results[rank] = InProcessCommunicator.get().all_reduce_coalesced(tensors)
+
+        threads = [
+            threading.Thread(target=run, args=(rank,)) for rank in range(world_size)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        InProcessCommunicator.shutdown()
+
+        # mixed dtypes are reduced separately and keep their dtype:
+        for result in results:
+            dtypes = [torch.long, torch.float32, torch.long]
+            self.assertEqual([x.dtype for x in result], dtypes)
+            self.assertEqual(result[0].item(), 2**61 + 1)
+            self.assertEqual(result[1].item(), 3.0)
+            self.assertEqual(result[2].tolist(), [1, 2])
+
+    def test_single_party(self) -> None:
+        InProcessCommunicator.initialize(0, 1)
+        try:
+            communicator = InProcessCommunicator.get()
+            tensor = torch.tensor([1, 2, 3])
+            tensors = [torch.tensor([2**60]), torch.tensor([1.5])]
+
+            results = {
+                "scatter": communicator.scatter([tensor], 0),
+                "reduce": communicator.reduce(tensor, 0),
+                "all_reduce": communicator.all_reduce(tensor),
+                "broadcast": communicator.broadcast(tensor, 0),
+            }
+            for name, result in results.items():
+                self.assertTrue(torch.is_tensor(result), name)
+                self.assertEqual(result.dtype, tensor.dtype, name)
+                self.assertEqual(result.tolist(), tensor.tolist(), name)
+
+            results = {
+                "gather": communicator.gather(tensor, 0),
+                "all_gather": communicator.all_gather(tensor),
+            }
+            for name, result in results.items():
+                self.assertIsInstance(result, list, name)
+                self.assertEqual(len(result), 1, name)
+                self.assertEqual(result[0].tolist(), tensor.tolist(), name)
+                results[name] = result[0]
+
+            coalesced = communicator.all_reduce_coalesced(tensors)
+            self.assertIsInstance(coalesced, list)
+            self.assertEqual([x.dtype for x in coalesced], [torch.long, torch.float32])
+            self.assertEqual([x.item() for x in coalesced], [2**60, 1.5])
+
+            # results are copies, as they are with multiple parties:
+            for name, result in results.items():
+                result.add_(1)
+                self.assertEqual(tensor.tolist(), [1, 2, 3], name)
+            for x, y in zip(coalesced, tensors):
+                self.assertNotEqual(x.data_ptr(), y.data_ptr())
+        finally:
+            InProcessCommunicator.shutdown()
+
+
 class CNN(nn.Module):
     def __init__(self):
         super(CNN, self).__init__()
@@ -691,6 +691,28 @@ class TestNN:
                     self.assertIsNone(encr_input.grad)
                     self.assertIsNone(encr_kernel.grad)
 
+    def test_conv_relu_pool2d(self):
+        """
+        Tests curl.nn.ConvReluPool2d module.
+        """
+        in_channels, out_channels, kernel_size = 3, 6, 5
+        input = get_random_test_tensor(size=(1, in_channels, 16, 16), is_float=True)
+        weight = get_random_test_tensor(
+            size=(out_channels, in_channels, kernel_size, kernel_size), is_float=True
+        )
+        bias = get_random_test_tensor(size=(out_channels,), is_float=True)
+
+        # create encrypted CrypTen module:
+        module = curl.nn.ConvReluPool2d(in_channels, out_channels, kernel_size)
+        module.set_parameter("weight", weight)
+        module.set_parameter("bias", bias)
+        module.encrypt()
+
+        # compare to conv -> relu -> max pool in PyTorch:
+        reference = F.max_pool2d(F.relu(F.conv2d(input, weight, bias)), 2)
+        encr_output = module(curl.cryptensor(input))
+        self._check(encr_output, reference, "ConvReluPool2d forward failed")
+
     def test_linear(self):
         """
         Tests curl.nn.Linear module.
@@ -939,6 +961,66 @@ class TestNN:
                     raise ValueError(f"Unsupported value of inputs: {num_inputs}")
                 self._check(encr_output, reference, "nn.Graph forward failed")
 
+    def test_graph_early_output(self):
+        """
+        Tests that curl.nn.Graph keeps outputs computed before the last module.
+        """
+        input_size = (3, 10)
+        input = get_random_test_tensor(size=input_size, is_float=True)
+        linear1 = get_random_linear(input_size[1], input_size[1])
+        linear2 = get_random_linear(input_size[1], input_size[1])
+
+        # the first output is consumed by the last module:
+        graph = curl.nn.Graph("input", ["linear", "output"])
+        graph.add_module("linear", linear_to_crypten(linear1), ["input"])
+        graph.add_module("output", linear_to_crypten(linear2), ["linear"])
+        graph.encrypt()
+
+        schedule = graph._get_schedule()
+        self.assertEqual([node for node, *_ in schedule], ["linear", "output"])
+        for _, _, _, release in schedule:
+            self.assertNotIn("linear", release, "nn.Graph released an output")
+
+        encr_hidden, encr_output = graph(curl.cryptensor(input))
+        hidden = linear1(input)
+        self._check(encr_hidden, hidden, "nn.Graph forward failed")
+        self._check(encr_output, linear2(hidden), "nn.Graph forward failed")
+
+    def test_graph_add_module(self):
+        """
+        Tests that curl.nn.Graph recomputes its schedule when a module is added.
+        """
+        input_size = (3, 10)
+        input = get_random_test_tensor(size=input_size, is_float=True)
+        encr_input = curl.cryptensor(input)
+        linear1 = get_random_linear(input_size[1], input_size[1])
+        linear2 = get_random_linear(input_size[1], input_size[1])
+
+        graph = curl.nn.Graph("input", "output")
+        graph.add_module("linear", linear_to_crypten(linear1), ["input"])
+        graph.add_module("output", curl.nn.Add(), ["input", "linear"])
+        graph.encrypt()
+        reference = linear1(input) + input
+        self._check(graph(encr_input), reference, "nn.Graph forward failed")
+
+        schedule = graph._get_schedule()
+        self.assertIs(graph._get_schedule(), schedule, "schedule not cached")
+
+        # add a module after the forward pass that consumes the output; it is
+        # not needed to compute the output, so it is not scheduled:
+        graph.add_module("extra", linear_to_crypten(linear2).encrypt(), ["output"])
+        schedule = graph._get_schedule()
+        self.assertEqual([node for node, *_ in schedule], ["linear", "output"])
+        self._check(graph(encr_input), reference, "nn.Graph forward failed")
+
+        # the new module is scheduled once it produces the output:
+        graph.output_names = ["extra"]
+        schedule = graph._get_schedule()
+        self.assertEqual([node for node, *_ in schedule], ["linear", "output", "extra"])
+        self.assertIn("output", schedule[2][3])
+        reference = linear2(reference)
+        self._check(graph(encr_input), reference, "nn.Graph forward failed")
+
     def test_losses(self):
         """
         Tests all Losses implemented in curl.nn.